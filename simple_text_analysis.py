@@ -1,6 +1,14 @@
 import re
+import sys
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from types import MappingProxyType
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 
@@ -10,128 +18,226 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _gevent_patched():
+    """Check whether the process was monkey-patched by a gevent worker"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+# Runs LanguageTool requests in the background while rule-based checks run.
+# This only overlaps work under sync (thread-per-request) workers; under
+# gevent the pool's threads are greenlets that cannot run during the
+# CPU-bound rule pass, and a fixed pool would queue calls from the
+# worker's many connections, so the API is called directly instead
+_executor = None if _gevent_patched() else ThreadPoolExecutor(max_workers=8)
+
+# Inputs shorter than this are left to the rule-based checks alone
+_MIN_LANGUAGETOOL_WORDS = 3
+
+# Reuse TCP/TLS connections to LanguageTool across requests
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+@lru_cache(maxsize=4096)
+def _fetch_languagetool(text):
+    """Fetch LanguageTool matches, caching successful responses by text"""
+    response = _session.post(
+        'https://api.languagetool.org/v2/check',
+        data={
+            'text': text,
+            'language': 'en-US'
+        },
+        timeout=10
+    )
+    
+    # Raise instead of returning None so failures are never cached
+    if response.status_code != 200:
+        raise requests.HTTPError(f"status {response.status_code}")
+    
+    # Cache only the fields the checker reads, as immutable
+    # (offset, length, replacement, message, category) tuples
+    matches = []
+    for match in response.json().get('matches', []):
+        if match.get('replacements'):
+            category = match.get('rule', {}).get('category', 'GRAMMAR')
+            if isinstance(category, dict):
+                category = category.get('id', 'GRAMMAR')
+            matches.append((
+                match['offset'],
+                match['length'],
+                match['replacements'][0]['value'],
+                match.get('message', 'Grammar error'),
+                category
+            ))
+    return tuple(matches)
+
+_COMMON_ERRORS = MappingProxyType({
+    # Subject-verb agreement
+    "i is": "I am",
+    "i are": "I am", 
+    "he are": "he is",
+    "she are": "she is",
+    "it are": "it is",
+    "we is": "we are",
+    "they is": "they are",
+    "you is": "you are",
+    
+    # Common verb errors
+    "store": "live",
+    "buyed": "bought",
+    "goed": "went",
+    "eated": "ate",
+    "runned": "ran",
+    "speaked": "spoke",
+    "teached": "taught",
+    "catched": "caught",
+    "bringed": "brought",
+    "thinked": "thought",
+    
+    # Preposition errors
+    "in home": "at home",
+    "on home": "at home",
+    "on japan": "in Japan",
+    "at japan": "in Japan",
+    "in school": "at school",
+    "on school": "at school",
+    
+    # Article errors
+    "a apple": "an apple",
+    "a hour": "an hour",
+    "an book": "a book",
+    "an university": "a university",
+    "a european": "a European",
+    
+    # Common speech recognition errors
+    "i name": "my name",
+    "me name": "my name",
+    "your name": "your name",
+    "his name": "his name", 
+    "her name": "her name",
+    "our name": "our name",
+    "their name": "their name",
+    
+    # Additional common errors
+    "should of": "should have",
+    "could of": "could have",
+    "would of": "would have",
+    "must of": "must have",
+})
+
+_CONTRACTIONS = MappingProxyType({
+    "i am": "I'm",
+    "you are": "you're",
+    "he is": "he's",
+    "she is": "she's",
+    "it is": "it's",
+    "we are": "we're",
+    "they are": "they're",
+    "is not": "isn't",
+    "are not": "aren't",
+    "do not": "don't",
+    "does not": "doesn't",
+    "did not": "didn't",
+    "have not": "haven't",
+    "has not": "hasn't",
+    "had not": "hadn't",
+    "will not": "won't",
+    "cannot": "can't",
+    "could not": "couldn't",
+    "should not": "shouldn't",
+    "would not": "wouldn't"
+})
+
+# One alternation over every contraction, longest phrase first so
+# overlapping phrases resolve to the longer one
+_CONTRACTIONS_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(wrong) for wrong in sorted(_CONTRACTIONS, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+# Latin-1 lookup table for \w characters, used for the trie's word-boundary
+# checks; code points above 255 fall back to str.isalnum()
+_WORD_CHARS = bytes(1 if chr(i).isalnum() or chr(i) == '_' else 0 for i in range(256))
+
+def _build_trie(phrases):
+    """Build a character trie mapping each phrase to its replacement"""
+    trie = {}
+    for wrong, right in phrases.items():
+        node = trie
+        for char in wrong:
+            node = node.setdefault(char, {})
+        node[None] = right
+    return trie
+
+# Character trie over the error phrases so all of them can be
+# matched in a single left-to-right scan of the text
+_COMMON_ERRORS_TRIE = _build_trie(_COMMON_ERRORS)
+
 class EnhancedGrammarChecker:
+    __slots__ = ('common_errors', 'contractions', '_error_trie', '_contractions_re')
+    
     def __init__(self):
-        self.common_errors = {
-            # Subject-verb agreement
-            "i is": "I am",
-            "i are": "I am", 
-            "he are": "he is",
-            "she are": "she is",
-            "it are": "it is",
-            "we is": "we are",
-            "they is": "they are",
-            "you is": "you are",
-            
-            # Common verb errors
-            "store": "live",
-            "buyed": "bought",
-            "goed": "went",
-            "eated": "ate",
-            "runned": "ran",
-            "speaked": "spoke",
-            "teached": "taught",
-            "catched": "caught",
-            "bringed": "brought",
-            "thinked": "thought",
-            
-            # Preposition errors
-            "in home": "at home",
-            "on home": "at home",
-            "on japan": "in Japan",
-            "at japan": "in Japan",
-            "in school": "at school",
-            "on school": "at school",
-            
-            # Article errors
-            "a apple": "an apple",
-            "a hour": "an hour",
-            "an book": "a book",
-            "an university": "a university",
-            "a european": "a European",
-            
-            # Common speech recognition errors
-            "i name": "My name",
-            "me name": "My name",
-            "your name": "your name",
-            "his name": "his name", 
-            "her name": "her name",
-            "our name": "our name",
-            "their name": "their name",
-            
-            # Additional common errors
-            "should of": "should have",
-            "could of": "could have",
-            "would of": "would have",
-            "must of": "must have",
-        }
-        
-        self.contractions = {
-            "i am": "I'm",
-            "you are": "you're",
-            "he is": "he's",
-            "she is": "she's",
-            "it is": "it's",
-            "we are": "we're",
-            "they are": "they're",
-            "is not": "isn't",
-            "are not": "aren't",
-            "do not": "don't",
-            "does not": "doesn't",
-            "did not": "didn't",
-            "have not": "haven't",
-            "has not": "hasn't",
-            "had not": "hadn't",
-            "will not": "won't",
-            "cannot": "can't",
-            "could not": "couldn't",
-            "should not": "shouldn't",
-            "would not": "wouldn't"
-        }
+        self.common_errors = _COMMON_ERRORS
+        self.contractions = _CONTRACTIONS
+        self._error_trie = _COMMON_ERRORS_TRIE
+        self._contractions_re = _CONTRACTIONS_RE
     
     def check_with_languagetool(self, text):
         """Use LanguageTool API for comprehensive grammar checking"""
         try:
-            response = requests.post(
-                'https://api.languagetool.org/v2/check',
-                data={
-                    'text': text,
-                    'language': 'en-US'
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.warning(f"LanguageTool API returned status {response.status_code}")
-                return None
+            return _fetch_languagetool(text)
         except Exception as e:
             logger.warning(f"LanguageTool API error: {e}")
             return None
     
     def correct_text(self, text):
         """Enhanced correction using both rule-based and API-based checking"""
+        result, _ = self._correct_text_checked(text)
+        return result
+    
+    def _correct_text_checked(self, text):
+        """Run correct_text, also reporting whether LanguageTool answered or was deliberately skipped"""
         if not text or not text.strip():
-            return text, [], 0, "No text provided"
+            return (text, [], 0, "No text provided", 0), True
         
         original = text.strip()
         corrections = []
+        total_words = len(original.split())
+        
+        # Step 1: Start the LanguageTool check so the HTTP round-trip
+        # overlaps with the rule-based corrections
+        capitalized = self._fix_capitalization(original)
+        check_api = total_words >= _MIN_LANGUAGETOOL_WORDS
+        api_future = None
+        if check_api and _executor is not None:
+            api_future = _executor.submit(self.check_with_languagetool, capitalized)
         
-        # Step 1: Apply rule-based corrections
-        corrected = self._fix_capitalization(original)
-        corrected, rule_corrections = self._apply_rule_corrections(corrected)
+        # Step 2: Find rule-based corrections
+        spans, rule_corrections = self._find_rule_corrections(capitalized)
         corrections.extend(rule_corrections)
         
-        # Step 2: Use LanguageTool API for additional corrections
-        api_result = self.check_with_languagetool(corrected)
-        if api_result and 'matches' in api_result:
-            api_corrections = self._process_api_results(corrected, api_result['matches'])
+        # Step 3: Merge LanguageTool API corrections
+        api_result = None
+        if api_future is not None:
+            try:
+                api_result = api_future.result(timeout=12)
+            except FutureTimeoutError:
+                # Free the pool slot if the call has not started yet
+                api_future.cancel()
+                logger.warning("LanguageTool API timed out")
+        elif check_api:
+            # gevent: the socket wait yields to other greenlets
+            api_result = self.check_with_languagetool(capitalized)
+        
+        if api_result:
+            api_spans, api_corrections = self._process_api_results(capitalized, api_result, spans)
+            spans.extend(api_spans)
             corrections.extend(api_corrections)
-            
-            # Apply API corrections
-            for correction in api_corrections:
-                corrected = self._apply_api_correction(corrected, correction)
+        
+        # Complete when the API answered or was deliberately skipped
+        api_checked = not check_api or api_result is not None
+        
+        # Apply all corrections in one pass
+        corrected = self._apply_spans(capitalized, spans)
         
         # Final cleanup
         corrected = self._fix_sentence_end(corrected)
@@ -142,54 +248,105 @@ class EnhancedGrammarChecker:
         # Generate analysis summary
         analysis_summary = self._generate_analysis_summary(original, corrected, total_errors)
         
-        return corrected, corrections, total_errors, analysis_summary
+        return (corrected, corrections, total_errors, analysis_summary, total_words), api_checked
     
-    def _apply_rule_corrections(self, text):
-        """Apply rule-based corrections"""
+    def _find_rule_corrections(self, text):
+        """Find rule-based corrections in a single pass over the text"""
+        spans = []
         corrections = []
-        corrected = text
         
-        for wrong, right in self.common_errors.items():
-            if self._contains_word(corrected, wrong):
-                before_correction = corrected
-                corrected = self._replace_word(corrected, wrong, right)
-                if before_correction != corrected:
-                    wrong_word = self._extract_word(before_correction, wrong)
-                    corrections.append({
-                        'original': wrong_word,
-                        'corrected': right,
-                        'message': f'"{wrong_word}" should be "{right}"',
-                        'category': 'GRAMMAR',
-                        'type': 'rule_based'
-                    })
+        lower_text = text.lower()
+        if len(lower_text) != len(text):
+            # Some characters expand when lowercased; keep offsets aligned
+            lower_text = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+        
+        length = len(text)
+        start = 0
+        while start < length:
+            # Phrases can only start at a word boundary
+            if start:
+                code = ord(lower_text[start - 1])
+                if _WORD_CHARS[code] if code < 256 else lower_text[start - 1].isalnum():
+                    start += 1
+                    continue
+            
+            # Walk the trie, keeping the longest phrase that ends on a boundary
+            node = self._error_trie
+            end = start
+            match_end = None
+            while end < length:
+                node = node.get(lower_text[end])
+                if node is None:
+                    break
+                end += 1
+                if None in node:
+                    code = ord(lower_text[end]) if end < length else 0
+                    if not (_WORD_CHARS[code] if code < 256 else lower_text[end].isalnum()):
+                        match_end = end
+                        right = node[None]
+            
+            if match_end is None:
+                start += 1
+                continue
+            
+            wrong_word = text[start:match_end]
+            replacement = self._match_case(right, wrong_word)
+            # Identity rows like "your name" must not count as errors
+            if replacement == wrong_word:
+                start = match_end
+                continue
+            
+            spans.append((start, match_end, replacement))
+            corrections.append({
+                'original': wrong_word,
+                'corrected': right,
+                'message': f'"{wrong_word}" should be "{right}"',
+                'category': 'GRAMMAR',
+                'type': 'rule_based'
+            })
+            start = match_end
         
-        return corrected, corrections
+        return spans, corrections
     
-    def _process_api_results(self, text, matches):
-        """Process LanguageTool API results"""
+    def _process_api_results(self, text, matches, taken_spans):
+        """Process LanguageTool API results, skipping matches that overlap taken spans"""
+        spans = []
         corrections = []
+        taken = list(taken_spans)
         
-        for match in matches:
-            if match.get('replacements'):
-                best_replacement = match['replacements'][0]['value']
-                wrong_text = text[match['offset']:match['offset'] + match['length']]
-                
-                # Avoid duplicates with rule-based corrections
-                if not any(corr['original'] == wrong_text and corr['corrected'] == best_replacement 
-                          for corr in corrections):
-                    corrections.append({
-                        'original': wrong_text,
-                        'corrected': best_replacement,
-                        'message': match.get('message', 'Grammar error'),
-                        'category': match.get('rule', {}).get('category', 'GRAMMAR'),
-                        'type': 'api_based'
-                    })
+        for start, length, best_replacement, message, category in matches:
+            end = start + length
+            
+            # Avoid duplicates with rule-based corrections
+            if any(start < taken_end and taken_start < end for taken_start, taken_end, _ in taken):
+                continue
+            
+            wrong_text = text[start:end]
+            spans.append((start, end, best_replacement))
+            taken.append((start, end, best_replacement))
+            corrections.append({
+                'original': wrong_text,
+                'corrected': best_replacement,
+                'message': message,
+                'category': category,
+                'type': 'api_based'
+            })
         
-        return corrections
+        return spans, corrections
     
-    def _apply_api_correction(self, text, correction):
-        """Apply API-based correction to text"""
-        return text.replace(correction['original'], correction['corrected'])
+    def _apply_spans(self, text, spans):
+        """Replace each (start, end, replacement) span in a single pass"""
+        if not spans:
+            return text
+        
+        pieces = []
+        pos = 0
+        for start, end, replacement in sorted(spans):
+            pieces.append(text[pos:start])
+            pieces.append(replacement)
+            pos = end
+        pieces.append(text[pos:])
+        return ''.join(pieces)
     
     def _generate_analysis_summary(self, original, corrected, total_errors):
         """Generate comprehensive analysis summary"""
@@ -198,28 +355,13 @@ class EnhancedGrammarChecker:
         else:
             return f"This sentence has {total_errors} error(s). The corrected version is: \"{corrected}\""
     
-    def _contains_word(self, text, word):
-        """Check if text contains a word (case insensitive)"""
-        return re.search(r'\b' + re.escape(word) + r'\b', text, re.IGNORECASE) is not None
-    
-    def _replace_word(self, text, wrong, right):
-        """Replace word preserving case"""
-        pattern = re.compile(r'\b' + re.escape(wrong) + r'\b', re.IGNORECASE)
-        return pattern.sub(lambda m: self._match_case(right, m.group()), text)
-    
-    def _extract_word(self, text, word):
-        """Extract the actual word from text"""
-        match = re.search(r'\b' + re.escape(word) + r'\b', text, re.IGNORECASE)
-        return match.group() if match else word
-    
     def _match_case(self, replacement, original):
         """Match the case of the replacement to the original"""
+        if not original[0].isupper():
+            return replacement
         if original.isupper():
             return replacement.upper()
-        elif original.istitle():
-            return replacement.title()
-        else:
-            return replacement.lower()
+        return replacement[0].upper() + replacement[1:]
     
     def _fix_capitalization(self, text):
         """Capitalize first letter of sentence"""
@@ -228,12 +370,16 @@ class EnhancedGrammarChecker:
         return text
     
     def _fix_contractions(self, text):
-        """Fix common contractions"""
-        corrected = text
-        for wrong, correct in self.contractions.items():
-            if self._contains_word(corrected, wrong):
-                corrected = self._replace_word(corrected, wrong, correct)
-        return corrected
+        """Fix common contractions in a single regex pass"""
+        def replace(match):
+            wrong = match.group()
+            correct = self.contractions.get(wrong.lower())
+            # IGNORECASE can match characters that do not lowercase back to a key
+            if not correct:
+                return wrong
+            return self._match_case(correct, wrong)
+        
+        return self._contractions_re.sub(replace, text)
     
     def _fix_sentence_end(self, text):
         """Add period if missing"""
@@ -244,6 +390,33 @@ class EnhancedGrammarChecker:
 # Initialize the enhanced grammar checker
 grammar_checker = EnhancedGrammarChecker()
 
+# Bounded LRU cache of analysis results, keyed by stripped text
+_CORRECT_CACHE_SIZE = 8192
+_correct_cache = OrderedDict()
+_correct_cache_lock = threading.Lock()
+
+def _cached_correct(text):
+    """Cached correct_text with corrections frozen to tuples"""
+    with _correct_cache_lock:
+        result = _correct_cache.get(text)
+        if result is not None:
+            _correct_cache.move_to_end(text)
+            return result
+    
+    result, api_checked = grammar_checker._correct_text_checked(text)
+    corrected, corrections, total_errors, analysis_summary, total_words = result
+    frozen = tuple(tuple(correction.items()) for correction in corrections)
+    result = corrected, frozen, total_errors, analysis_summary, total_words
+    
+    # Results computed while LanguageTool was unavailable are not cached
+    if api_checked:
+        with _correct_cache_lock:
+            _correct_cache[text] = result
+            _correct_cache.move_to_end(text)
+            if len(_correct_cache) > _CORRECT_CACHE_SIZE:
+                _correct_cache.popitem(last=False)
+    return result
+
 @app.route('/analyze-text', methods=['POST'])
 def analyze_text_endpoint():
     """Enhanced endpoint for analyzing text with hybrid approach"""
@@ -269,10 +442,10 @@ def analyze_text_endpoint():
         logger.info(f"Analyzing text: {text}")
         
         # Analyze the text with enhanced checker
-        corrected_text, corrections, wrong_word_count, analysis_summary = grammar_checker.correct_text(text)
+        corrected_text, corrections, wrong_word_count, analysis_summary, total_words = _cached_correct(text)
+        corrections = [dict(correction) for correction in corrections]
         
         # Calculate confidence
-        total_words = len(text.split())
         confidence = max(0.0, 1.0 - (wrong_word_count / max(1, total_words)))
         
         result = {
@@ -287,7 +460,7 @@ def analyze_text_endpoint():
         
         logger.info(f"Analysis complete. Found {wrong_word_count} errors.")
         
-        return jsonify(result)
+        return app.response_class(orjson.dumps(result), mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error in analyze-text endpoint: {str(e)}")